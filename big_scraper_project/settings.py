@@ -120,4 +120,15 @@ CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "amqp://rabbitmq")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", "rpc://")
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
-CELERY_RESULT_SERIALIZER = "json"
\ No newline at end of file
+CELERY_RESULT_SERIALIZER = "json"
+# nothing polls task results; tasks that feed a chord opt back in with ignore_result=False
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_RESULT_EXPIRES = 3600
+# page tasks are slow and I/O bound: don't let one worker hoard them
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# page fan-out runs on its own queue (see README for the worker command)
+CELERY_TASK_ROUTES = {"scraper_api.tasks.parse_page": {"queue": "parse"}}
+
+# Redis used for per-site rate limit slots shared by all workers.
+# Leave empty to fall back to per-process rate limiting.
+SCRAPER_RATE_LIMIT_REDIS_URL = os.environ.get("SCRAPER_RATE_LIMIT_REDIS_URL", "")
\ No newline at end of file
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ScraperApiConfig(AppConfig):
     name = "scraper_api"
+
+    def ready(self):
+        from . import signals  # noqa: F401
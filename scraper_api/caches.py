@@ -0,0 +1,53 @@
+# scraper_api/caches.py
+"""
+Worker/process-local lookup caches with a short TTL.
+
+Signals (scraper_api.signals) clear them on saves made in this process; the
+TTL bounds how long a change made by any other process can go unnoticed.
+Entries hold plain column values, never model instances, so callers always
+get an object of their own.
+"""
+import time
+
+from .models import Author, ScrapeSite
+
+# Site configs change rarely; they are re-read at most every SITE_CACHE_TTL seconds.
+SITE_CACHE_TTL = 60
+_SITE_FIELDS = [f.attname for f in ScrapeSite._meta.concrete_fields]
+_SITE_CACHE: dict[int, tuple[float, tuple]] = {}
+
+# A cached author id can outlive the row by up to AUTHOR_CACHE_TTL seconds.
+AUTHOR_CACHE_TTL = 60
+AUTHOR_CACHE_MAX = 10_000
+_AUTHOR_CACHE: dict[str, tuple[float, int]] = {}
+
+
+def get_site(site_id: int) -> ScrapeSite:
+    """Return a fresh ScrapeSite built from the cached row; raises ScrapeSite.DoesNotExist."""
+    now = time.monotonic()
+    cached = _SITE_CACHE.get(site_id)
+    if cached is None or cached[0] <= now:
+        row = ScrapeSite.objects.values_list(*_SITE_FIELDS).get(pk=site_id)
+        cached = _SITE_CACHE[site_id] = (now + SITE_CACHE_TTL, row)
+    return ScrapeSite.from_db(ScrapeSite.objects.db, _SITE_FIELDS, cached[1])
+
+
+def clear_site_cache():
+    _SITE_CACHE.clear()
+
+
+def get_author_id(name: str) -> int:
+    """Name -> author id; only misses hit Author.ensure (which burns an id on conflict)."""
+    now = time.monotonic()
+    cached = _AUTHOR_CACHE.get(name)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    if len(_AUTHOR_CACHE) >= AUTHOR_CACHE_MAX:
+        _AUTHOR_CACHE.clear()
+    author_id = Author.ensure(name)
+    _AUTHOR_CACHE[name] = (now + AUTHOR_CACHE_TTL, author_id)
+    return author_id
+
+
+def clear_author_cache():
+    _AUTHOR_CACHE.clear()
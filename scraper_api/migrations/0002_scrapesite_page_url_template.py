@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-15 08:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraper_api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scrapesite",
+            name="page_url_template",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="Page path with a {page} placeholder, e.g. /page/{page}/ (optional). Enables parallel page fetches.",
+                max_length=500,
+            ),
+        ),
+    ]
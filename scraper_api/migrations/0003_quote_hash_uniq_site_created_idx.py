@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-15 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraper_api", "0002_scrapesite_page_url_template"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="quote",
+            name="scraper_api_site_id_bc7392_idx",
+        ),
+        migrations.AlterField(
+            model_name="quote",
+            name="hash",
+            field=models.CharField(max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name="quote",
+            index=models.Index(
+                fields=["site", "created_at"], name="scraper_api_site_id_1f8333_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="quote",
+            constraint=models.UniqueConstraint(fields=("hash",), name="quote_hash_uniq"),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-15 08:40
+
+import hashlib
+
+import xxhash
+from django.db import migrations, models
+
+
+def _payload(quote) -> bytes:
+    # same normalization as scraper_api.models.compute_quote_hash
+    norm_text = " ".join((quote.text or "").strip().split()).lower()
+    norm_author = (quote.author.name if quote.author else "").strip().lower()
+    return f"{norm_text}|{norm_author}".encode("utf-8")
+
+
+def _rehash(apps, hasher, batch_size=1000):
+    Quote = apps.get_model("scraper_api", "Quote")
+    batch = []
+    for quote in Quote.objects.select_related("author").only("id", "text", "author__name").iterator(chunk_size=batch_size):
+        quote.hash = hasher(_payload(quote))
+        batch.append(quote)
+        if len(batch) >= batch_size:
+            Quote.objects.bulk_update(batch, ["hash"])
+            batch = []
+    if batch:
+        Quote.objects.bulk_update(batch, ["hash"])
+
+
+def to_xxh3(apps, schema_editor):
+    _rehash(apps, xxhash.xxh3_128_hexdigest)
+
+
+def to_sha256(apps, schema_editor):
+    _rehash(apps, lambda payload: hashlib.sha256(payload).hexdigest())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraper_api", "0003_quote_hash_uniq_site_created_idx"),
+    ]
+
+    operations = [
+        # rehash while the column is still wide enough for both digests
+        migrations.RunPython(to_xxh3, to_sha256),
+        migrations.AlterField(
+            model_name="quote",
+            name="hash",
+            field=models.CharField(max_length=32),
+        ),
+    ]
@@ -1,20 +1,22 @@
 # scraper_api/models.py
 from uuid import uuid4
-import hashlib
-from django.db import models, transaction
+import xxhash
+from django.db import connection, models
+from django.db.models import F
 from django.utils import timezone
 from django.core.validators import MinValueValidator
 
 
 def compute_quote_hash(text: str, author_name: str | None) -> str:
     """
-    Normalizes minimaly and returns a sha256 hex digest.
+    Normalizes minimaly and returns a 128-bit xxh3 hex digest.
+    Only used for dedupe, so a fast non-cryptographic hash is enough.
     Keeps function pure and testable.
     """
     norm_text = " ".join((text or "").strip().split()).lower()
     norm_author = (author_name or "").strip().lower()
     payload = f"{norm_text}|{norm_author}"
-    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    return xxhash.xxh3_128_hexdigest(payload.encode("utf-8"))
 
 
 class TimeStampedModel(models.Model):
@@ -38,6 +40,10 @@ class ScrapeSite(TimeStampedModel):
     quote_selector = models.CharField(max_length=500, help_text="CSS or XPath for quote text")
     author_selector = models.CharField(max_length=500, help_text="CSS or XPath for author name")
     pagination_selector = models.CharField(max_length=500, blank=True, default="", help_text="CSS/XPath for next page link (optional)")
+    page_url_template = models.CharField(
+        max_length=500, blank=True, default="",
+        help_text="Page path with a {page} placeholder, e.g. /page/{page}/ (optional). Enables parallel page fetches.",
+    )
     max_pages = models.PositiveIntegerField(default=50, validators=[MinValueValidator(1)])
     rate_limit_ms = models.PositiveIntegerField(default=500, help_text="Delay between requests in milliseconds")
     active = models.BooleanField(default=True)
@@ -54,6 +60,33 @@ class Author(TimeStampedModel):
     name = models.CharField(max_length=250, unique=True)
     bio_url = models.URLField(blank=True, null=True)
 
+    @classmethod
+    def ensure(cls, name: str) -> int:
+        """
+        Return the id of the author with this name, creating it if needed,
+        in a single INSERT ... ON CONFLICT ... RETURNING statement.
+        The no-op DO UPDATE makes RETURNING fire on conflict as well, but each
+        conflicting call still consumes an id from the sequence, so callers
+        should go through the cached caches.get_author_id rather than call
+        this per request.
+        Falls back to get_or_create on backends without upsert RETURNING
+        (e.g. MySQL, SQLite < 3.35).
+        """
+        features = connection.features
+        if not (features.supports_update_conflicts_with_target and features.can_return_columns_from_insert):
+            return cls.objects.get_or_create(name=name)[0].pk
+        qn = connection.ops.quote_name
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        name_col = qn("name")
+        sql = (
+            f"INSERT INTO {qn(cls._meta.db_table)} ({name_col}, {qn('created_at')}, {qn('updated_at')}) "
+            f"VALUES (%s, %s, %s) "
+            f"ON CONFLICT ({name_col}) DO UPDATE SET {name_col} = EXCLUDED.{name_col} RETURNING {qn('id')}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [name, now, now])
+            return cursor.fetchone()[0]
+
     def __str__(self) -> str:
         return self.name
 
@@ -94,6 +127,8 @@ class ScrapeJob(TimeStampedModel):
         If there were errors but some quotes saved -> PARTIAL
         If success is False and no quotes saved -> FAILED
         """
+        # counters are incremented in the DB, so this instance may be stale
+        self.refresh_from_db(fields=["quotes_fetched", "quotes_saved", "errors_count"])
         self.finished_at = timezone.now()
         if not success:
             # Caller can set success=False for fatal failures
@@ -109,16 +144,16 @@ class ScrapeJob(TimeStampedModel):
 
     def increment_counters(self, fetched: int = 0, saved: int = 0, errors: int = 0):
         """
-        Safe counter increments via a transaction to avoid races.
+        Atomic counter increments via a single UPDATE with F() expressions,
+        so concurrent page subtasks never race or lock the row.
         Call from worker tasks after each page or batch.
         """
-        with transaction.atomic():
-            # Refetch for DB-level consistency
-            job = ScrapeJob.objects.select_for_update().get(pk=self.pk)
-            job.quotes_fetched = job.quotes_fetched + fetched
-            job.quotes_saved = job.quotes_saved + saved
-            job.errors_count = job.errors_count + errors
-            job.save(update_fields=["quotes_fetched", "quotes_saved", "errors_count", "updated_at"])
+        ScrapeJob.objects.filter(pk=self.pk).update(
+            quotes_fetched=F("quotes_fetched") + fetched,
+            quotes_saved=F("quotes_saved") + saved,
+            errors_count=F("errors_count") + errors,
+            updated_at=timezone.now(),
+        )
 
     def __str__(self) -> str:
         return f"Job {self.pk} - {self.site.name} - {self.status}"
@@ -148,23 +183,76 @@ class Quote(TimeStampedModel):
     author = models.ForeignKey(Author, on_delete=models.SET_NULL, null=True, blank=True, related_name="quotes")
     site = models.ForeignKey(ScrapeSite, on_delete=models.PROTECT, related_name="quotes")
     source_url = models.URLField(max_length=1000, blank=True, null=True)
-    hash = models.CharField(max_length=64, unique=True, db_index=True)  # sha256 hex
+    hash = models.CharField(max_length=32)  # xxh3_128 hex, unique via Meta.constraints
     saved_by_job = models.ForeignKey(ScrapeJob, on_delete=models.SET_NULL, null=True, blank=True, related_name="saved_quotes")
 
     class Meta:
         ordering = ["-created_at"]
         indexes = [
             models.Index(fields=["author"]),
-            models.Index(fields=["site"]),
+            # also serves plain site filters (leftmost prefix)
+            models.Index(fields=["site", "created_at"]),
         ]
+        constraints = [
+            # conflict target for bulk_create(ignore_conflicts=True) -> ON CONFLICT DO NOTHING
+            models.UniqueConstraint(fields=["hash"], name="quote_hash_uniq"),
+        ]
+
+    @classmethod
+    def insert_new(cls, quotes: list["Quote"], batch_size: int = 500) -> int:
+        """
+        Insert quotes whose hash is not stored yet and return how many were inserted.
+        One INSERT ... ON CONFLICT (hash) DO NOTHING RETURNING id per batch, so the
+        count is exact without a pre-SELECT, even with parallel workers.
+        Falls back to a hash lookup + bulk_create on backends without RETURNING
+        (e.g. SQLite < 3.35) or without ON CONFLICT (target) (MySQL/MariaDB).
+        """
+        features = connection.features
+        if not (features.supports_update_conflicts_with_target and features.can_return_rows_from_bulk_insert):
+            known = set(cls.objects.filter(hash__in=[q.hash for q in quotes]).values_list("hash", flat=True))
+            new = [q for q in quotes if q.hash not in known]
+            cls.objects.bulk_create(new, ignore_conflicts=True, batch_size=batch_size)
+            return len(new)
+        fields = [f for f in cls._meta.concrete_fields if not f.primary_key]
+        qn = connection.ops.quote_name
+        columns = ", ".join(qn(f.column) for f in fields)
+        placeholder = "(" + ", ".join(["%s"] * len(fields)) + ")"
+        # stay under the backend's bound-parameter limit, as bulk_create does
+        batch_size = min(batch_size, max(connection.ops.bulk_batch_size(fields, quotes), 1))
+        inserted = 0
+        with connection.cursor() as cursor:
+            for start in range(0, len(quotes), batch_size):
+                batch = quotes[start:start + batch_size]
+                sql = (
+                    f"INSERT INTO {qn(cls._meta.db_table)} ({columns}) VALUES {', '.join([placeholder] * len(batch))} "
+                    f"ON CONFLICT ({qn('hash')}) DO NOTHING RETURNING {qn('id')}"
+                )
+                # pre_save fills auto_now timestamps the same way Model.save() would
+                params = [f.get_db_prep_save(f.pre_save(q, True), connection) for q in batch for f in fields]
+                cursor.execute(sql, params)
+                inserted += len(cursor.fetchall())
+        return inserted
 
     def save(self, *args, **kwargs):
         # Ensure hash is set before saving if missing.
         if not self.hash:
-            author_name = self.author.name if self.author else ""
-            self.hash = compute_quote_hash(self.text, author_name)
+            self.hash = compute_quote_hash(self.text, self._hash_author_name())
         super().save(*args, **kwargs)
 
+    def _hash_author_name(self) -> str:
+        """
+        Author name for the hash, avoiding an Author fetch where possible.
+        Callers that only set author_id can pass the name via _author_name_cache.
+        """
+        name = getattr(self, "_author_name_cache", None)
+        if name is not None:
+            return name
+        if self.author_id is None:
+            return ""
+        if Quote.author.is_cached(self):
+            return self.author.name
+        return Author.objects.filter(pk=self.author_id).values_list("name", flat=True).first() or ""
+
     def __str__(self) -> str:
         short = (self.text[:60] + "...") if len(self.text) > 60 else self.text
         return f"Quote({short}) - {self.author.name if self.author else 'Unknown'}"
@@ -2,9 +2,31 @@
 from typing import Any, Dict, Optional
 from django.utils import timezone
 from rest_framework import serializers
+from .caches import get_author_id, get_site
 from .models import ScrapeSite, Author, Quote, ScrapeJob, ScrapeError
 
 
+class ActiveSiteField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField for active sites, checked against the site cache.
+    Returns an instance with only id and active loaded; other fields are
+    read from the database if something asks for them.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            site = get_site(int(data))
+        except ScrapeSite.DoesNotExist:
+            self.fail("does_not_exist", pk_value=data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if not site.active:
+            self.fail("does_not_exist", pk_value=data)
+        return ScrapeSite.from_db(ScrapeSite.objects.db, ["id", "active"], [site.pk, site.active])
+
+
 class ScrapeSiteSerializer(serializers.ModelSerializer):
     class Meta:
         model = ScrapeSite
@@ -16,6 +38,7 @@ class ScrapeSiteSerializer(serializers.ModelSerializer):
             "quote_selector",
             "author_selector",
             "pagination_selector",
+            "page_url_template",
             "max_pages",
             "rate_limit_ms",
             "active",
@@ -40,7 +63,7 @@ class QuoteSerializer(serializers.ModelSerializer):
     author_name = serializers.CharField(
         write_only=True, required=False, allow_blank=True, help_text="Use when creating an author inline."
     )
-    site = serializers.PrimaryKeyRelatedField(queryset=ScrapeSite.objects.filter(active=True))
+    site = ActiveSiteField(queryset=ScrapeSite.objects.filter(active=True))
     saved_by_job = serializers.PrimaryKeyRelatedField(queryset=ScrapeJob.objects.all(), required=False, allow_null=True)
 
     class Meta:
@@ -73,21 +96,50 @@ class QuoteSerializer(serializers.ModelSerializer):
         author = validated_data.pop("author", None)
         author_name = validated_data.pop("author_name", "").strip()
 
-        # create or get author if name provided
-        if not author and author_name:
-            author, _ = Author.objects.get_or_create(name=author_name)
-
         # do not allow creating quote with inactive site
         site = validated_data.get("site")
         if not site.active:
             raise serializers.ValidationError({"site": "Specified site is not active for scraping."})
 
+        if author:
+            quote = Quote(author=author, **validated_data)
+        elif author_name:
+            # get or create author by name; the known name saves save() an author fetch
+            quote = Quote(author_id=get_author_id(author_name), **validated_data)
+            quote._author_name_cache = author_name
+        else:
+            quote = Quote(**validated_data)
         # Compute hash will be handled in model.save() if missing
-        quote = Quote(author=author, **validated_data)
         quote.save()
         return quote
 
 
+# shared unbound field, used only for its DRF-consistent datetime output format
+_DATETIME_FIELD = serializers.DateTimeField()
+
+
+class QuoteReadSerializer(serializers.Serializer):
+    """
+    Read-only fast path for quote list/detail responses. Produces the same
+    payload as QuoteSerializer but builds the dict directly from the instance,
+    skipping per-field resolution (FKs are read from their *_id columns).
+    """
+
+    def to_representation(self, obj: Quote) -> Dict[str, Any]:
+        to_datetime = _DATETIME_FIELD.to_representation
+        return {
+            "id": obj.id,
+            "text": obj.text,
+            "author": obj.author_id,
+            "site": obj.site_id,
+            "source_url": obj.source_url,
+            "hash": obj.hash,
+            "saved_by_job": obj.saved_by_job_id,
+            "created_at": to_datetime(obj.created_at),
+            "updated_at": to_datetime(obj.updated_at),
+        }
+
+
 class ScrapeErrorSerializer(serializers.ModelSerializer):
     class Meta:
         model = ScrapeError
@@ -96,7 +148,7 @@ class ScrapeErrorSerializer(serializers.ModelSerializer):
 
 
 class ScrapeJobSerializer(serializers.ModelSerializer):
-    site = serializers.PrimaryKeyRelatedField(queryset=ScrapeSite.objects.filter(active=True))
+    site = ActiveSiteField(queryset=ScrapeSite.objects.filter(active=True))
     # nicer status output for read operations
     status_display = serializers.SerializerMethodField(read_only=True)
     meta = serializers.JSONField(required=False)
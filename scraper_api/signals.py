@@ -0,0 +1,20 @@
+# scraper_api/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import caches
+from .models import Author, ScrapeSite
+
+
+@receiver(post_save, sender=ScrapeSite)
+@receiver(post_delete, sender=ScrapeSite)
+def clear_site_cache(sender, **kwargs):
+    caches.clear_site_cache()
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def clear_author_cache(sender, created=False, **kwargs):
+    # new authors can't be stale in the cache; only renames/deletes invalidate it
+    if not created:
+        caches.clear_author_cache()
@@ -1,19 +1,97 @@
 # scraper_api/tasks.py
 import time
 import logging
-from urllib.parse import urljoin, urlparse
+from functools import lru_cache
+from itertools import zip_longest
+from urllib.parse import urldefrag, urljoin, urlparse
 
+import redis
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from selectolax.lexbor import LexborHTMLParser
 
-from celery import shared_task, Task
+from celery import chord, shared_task, Task
+from celery.exceptions import Retry
 from celery.utils.log import get_task_logger
-from django.db import IntegrityError, transaction
+from django.conf import settings
+from django.db import DatabaseError, transaction
 
+from .caches import get_site
 from .models import ScrapeJob, ScrapeSite, Author, Quote, ScrapeError, compute_quote_hash
 
 logger = get_task_logger(__name__)
 DEFAULT_HEADERS = {"User-Agent": "big_scraper_project/1.0 (+https://example.com)"}
+# Upper bound on bytes read per page; keeps worker memory bounded on huge responses.
+MAX_PAGE_BYTES = 5 * 1024 * 1024
+
+# Keep-alive sessions per host, shared by all tasks running in this worker process.
+_SESSIONS: dict[str, requests.Session] = {}
+
+
+def _load_job(job_id: str) -> tuple[ScrapeJob, ScrapeSite]:
+    """
+    Load a job without joining its site; the site comes from the short-TTL
+    worker-local cache in scraper_api.caches.
+    """
+    job = ScrapeJob.objects.get(pk=job_id)
+    site = get_site(job.site_id)
+    job.site = site
+    return job, site
+
+
+def _get_session(base_url: str) -> requests.Session:
+    """Return a pooled requests.Session for the host of base_url."""
+    host = urlparse(base_url).netloc
+    session = _SESSIONS.get(host)
+    if session is None:
+        session = requests.Session()
+        session.headers.update(DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _SESSIONS[host] = session
+    return session
+
+
+# Rate-limit requeues get their own budget, separate from BaseTaskWithRetry.max_retries.
+RATE_LIMIT_MAX_REQUEUES = 10_000
+
+# Fallback politeness slots (site id -> monotonic time) when no Redis is configured.
+_LOCAL_SLOTS: dict[int, float] = {}
+
+
+@lru_cache(maxsize=1)
+def _get_redis():
+    url = settings.SCRAPER_RATE_LIMIT_REDIS_URL
+    return redis.Redis.from_url(url) if url else None
+
+
+def _claim_rate_slot(site: ScrapeSite) -> bool:
+    """
+    Try to claim the site's politeness slot for one request, without blocking.
+    With Redis the slot is a `SET NX PX` key shared by every worker; otherwise
+    it only holds within this worker process.
+    """
+    if not site.rate_limit_ms:
+        return True
+    client = _get_redis()
+    if client is not None:
+        return bool(client.set(f"ratelimit:{site.pk}", 1, nx=True, px=site.rate_limit_ms))
+    now = time.monotonic()
+    if now < _LOCAL_SLOTS.get(site.pk, 0.0):
+        return False
+    _LOCAL_SLOTS[site.pk] = now + site.rate_limit_ms / 1000.0
+    return True
+
+
+def _chords_supported(app) -> bool:
+    """False for result backends that cannot run a chord (rpc://, or none configured)."""
+    try:
+        app.backend.ensure_chords_allowed()
+    except NotImplementedError:
+        logger.warning("result backend %s cannot run chords, scraping sequentially", app.conf.result_backend)
+        return False
+    return True
 
 
 class BaseTaskWithRetry(Task):
@@ -23,127 +101,238 @@ class BaseTaskWithRetry(Task):
     retry_jitter = True
 
 
-@shared_task(bind=True, base=BaseTaskWithRetry)
+# Column limits checked before the bulk inserts, so one bad row can't fail the page.
+AUTHOR_NAME_MAX_LENGTH = Author._meta.get_field("name").max_length
+SOURCE_URL_MAX_LENGTH = Quote._meta.get_field("source_url").max_length
+
+
+def _save_quotes(job: ScrapeJob, site: ScrapeSite, url: str, rows, page_errors: list[ScrapeError]) -> int:
+    """
+    Persist a page worth of (text, author_name) pairs in bulk.
+    Idempotency relies on the unique constraint on Quote.hash; duplicates are
+    skipped by the DB (see Quote.insert_new). Rows that don't fit the columns
+    are skipped and added to page_errors. Returns the number of new quotes.
+    """
+    quotes_by_hash = {}
+    for text, author_name in rows:
+        if author_name and len(author_name) > AUTHOR_NAME_MAX_LENGTH:
+            page_errors.append(ScrapeError(
+                job=job, url=url, error_type="parse",
+                message=f"author name longer than {AUTHOR_NAME_MAX_LENGTH} characters: {author_name[:100]}...",
+            ))
+            continue
+        h = compute_quote_hash(text, author_name)
+        quotes_by_hash.setdefault(h, (text, author_name))
+    if not quotes_by_hash:
+        return 0
+    if len(url) > SOURCE_URL_MAX_LENGTH:
+        # ScrapeError.url has the same limit, so the url goes in the message
+        page_errors.append(ScrapeError(
+            job=job, url=None, error_type="parse",
+            message=f"page url longer than {SOURCE_URL_MAX_LENGTH} characters, quotes not saved: {url}",
+        ))
+        return 0
+
+    names = {author_name for _, author_name in quotes_by_hash.values() if author_name}
+    authors = {}
+    if names:
+        Author.objects.bulk_create([Author(name=n) for n in names], ignore_conflicts=True)
+        authors = Author.objects.filter(name__in=names).in_bulk(field_name="name")
+
+    return Quote.insert_new(
+        [
+            Quote(
+                text=text,
+                author=authors.get(author_name) if author_name else None,
+                site=site,
+                source_url=url,
+                hash=h,
+                saved_by_job=job,
+            )
+            for h, (text, author_name) in quotes_by_hash.items()
+        ]
+    )
+
+
+def _read_body(resp: requests.Response, url: str) -> bytes:
+    """
+    Read a streamed response body in chunks, stopping at MAX_PAGE_BYTES.
+    Skips requests' str decoding entirely; an oversized page is truncated
+    (the HTML parser tolerates a cut-off document) rather than buffered whole.
+    """
+    chunks = []
+    size = 0
+    for chunk in resp.iter_content(chunk_size=65536):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= MAX_PAGE_BYTES:
+            logger.warning("page %s exceeds %s bytes, truncating", url, MAX_PAGE_BYTES)
+            break
+    return b"".join(chunks)[:MAX_PAGE_BYTES]
+
+
+def _decode_body(resp: requests.Response, body: bytes) -> str | bytes:
+    """
+    Decode the body with the charset from the Content-Type header, if it
+    carries one. Otherwise the bytes are returned as-is so the parser can
+    pick the encoding up from a BOM or <meta charset> (falling back to UTF-8).
+    """
+    if "charset=" not in resp.headers.get("Content-Type", "").lower():
+        return body
+    try:
+        return body.decode(resp.encoding, errors="replace")
+    except LookupError:
+        logger.warning("unknown charset %r for %s", resp.encoding, resp.url)
+        return body
+
+
+def _scrape_page(job: ScrapeJob, site: ScrapeSite, session: requests.Session, url: str, missing_ok: bool = False):
+    """
+    Fetch a single page, save its quotes and record per-row errors.
+    Returns (tree, fetched, saved, errors); tree is None when nothing was fetched.
+    With missing_ok a 404 is treated as "past the last page" rather than an error.
+    """
+    try:
+        with session.get(url, timeout=10, stream=True) as resp:
+            if missing_ok and resp.status_code == 404:
+                return None, 0, 0, 0
+            resp.raise_for_status()
+            document = _decode_body(resp, _read_body(resp, url))
+    except Exception as e:
+        ScrapeError.objects.create(job=job, url=url, error_type="network", message=str(e))
+        return None, 0, 0, 1
+
+    # parse errors are buffered and written in one batch with the page's quotes
+    page_errors: list[ScrapeError] = []
+    # a header charset has already been applied; for raw bytes lexbor reads
+    # the BOM / <meta charset> and otherwise assumes UTF-8
+    tree = LexborHTMLParser(document, encoding=True)
+
+    # find quote elements
+    quote_nodes = tree.css(site.quote_selector)
+    author_nodes = tree.css(site.author_selector) if site.author_selector else []
+
+    # heuristics: pair quotes and authors by position; quotes left without an
+    # author fall back to looking for the author selector inside the quote node
+    texts = [q.text(separator=" ", strip=True) for q in quote_nodes]
+    authors = [a.text(separator=" ", strip=True) for a in author_nodes]
+    rows = list(zip_longest(texts, authors[:len(texts)]))
+    if len(authors) < len(texts) and site.author_selector:
+        for i in range(len(authors), len(texts)):
+            try:
+                possible = quote_nodes[i].css_first(site.author_selector)
+                if possible:
+                    rows[i] = (texts[i], possible.text(separator=" ", strip=True))
+            except Exception as ex:
+                page_errors.append(ScrapeError(job=job, url=url, error_type="parse", message=str(ex)))
+                logger.exception("parse error on %s", url)
+
+    try:
+        with transaction.atomic():
+            saved = _save_quotes(job, site, url, rows, page_errors)
+    except DatabaseError as ex:
+        # anything the checks above miss costs this page, not the whole job
+        saved = 0
+        page_errors.append(ScrapeError(job=job, url=url, error_type="parse", message=str(ex)))
+        logger.exception("could not save quotes from %s", url)
+    if page_errors:
+        ScrapeError.objects.bulk_create(page_errors, batch_size=200)
+    return tree, 1, saved, len(page_errors)
+
+
+def _next_page_url(site: ScrapeSite, tree) -> str | None:
+    """Resolve the next page link from a parsed page, if any."""
+    if site.pagination_selector:
+        nxt = tree.css_first(site.pagination_selector)
+        if nxt:
+            href = nxt.attributes.get("href") or nxt.attributes.get("data-href")
+            if href:
+                # create absolute url
+                return urljoin(site.base_url, href)
+        return None
+    # fallback: try to find "a[rel=next]" or a link with "next" text
+    nxt = tree.css_first("a[rel=next]") or next(
+        (a for a in tree.css("a") if a.text(strip=True).lower() in ("next", "›", "»")), None
+    )
+    if nxt and nxt.attributes.get("href"):
+        return urljoin(site.base_url, nxt.attributes.get("href"))
+    return None
+
+
+@shared_task(bind=True, base=BaseTaskWithRetry, ignore_result=True)
 def enqueue_scrape_job(self, job_id: str):
     """
     Worker entrypoint invoked by API. Loads job and triggers scrape_site.
     This task keeps a simple decoupling layer.
     """
     logger.info("enqueue_scrape_job start: %s", job_id)
-    job = ScrapeJob.objects.select_related("site").get(pk=job_id)
+    job = ScrapeJob.objects.get(pk=job_id)
     # Kick off the actual scrape (synchronous call inside worker process)
     scrape_site.apply_async(args=[str(job.id)])
     return {"job_id": job_id, "status": "enqueued"}
 
 
-@shared_task(bind=True, base=BaseTaskWithRetry)
-def scrape_site(self, job_id: str):
+@shared_task(bind=True, base=BaseTaskWithRetry, ignore_result=True)
+def scrape_site(self, job_id: str, next_url: str | None = None, page_index: int = 0):
     """
-    Main scraping task. This is intentionally simple: fetch sequential pages
-    following pagination_selector or page links up to max_pages.
-    For scale you can split pages into subtasks (parse_page).
+    Main scraping task.
+    Sites with a page_url_template get one parse_page subtask per page, run as a
+    chord that closes the job in finalize_job (or mark_job_failed if the chord
+    itself fails), provided the result backend supports chords. Otherwise pages
+    are fetched sequentially following pagination_selector or page links up to max_pages;
+    when the site's rate limit slot is taken the task re-enqueues itself from
+    next_url/page_index instead of sleeping.
     """
     logger.info("scrape_site start: %s", job_id)
-    job = ScrapeJob.objects.select_related("site").get(pk=job_id)
-    site: ScrapeSite = job.site
-
-    job.mark_running()
+    job, site = _load_job(job_id)
 
-    headers = DEFAULT_HEADERS.copy()
-    pages_scraped = []
-    saved = 0
-    fetched = 0
-    errors = 0
+    if next_url is None:
+        job.mark_running()
 
     try:
-        start_url = urljoin(site.base_url, site.start_path or "/")
-        next_url = start_url
-        for page_index in range(site.max_pages):
-            if not next_url:
-                break
+        if next_url is None and site.page_url_template and _chords_supported(self.app):
+            urls = [
+                urljoin(site.base_url, site.page_url_template.format(page=n))
+                for n in range(1, site.max_pages + 1)
+            ]
+            # stagger subtasks by the site's rate limit instead of sleeping in a worker
+            delay = site.rate_limit_ms / 1000.0
+            chord(
+                parse_page.s(job_id, url).set(countdown=i * delay) for i, url in enumerate(urls)
+            )(finalize_job.s(job_id).on_error(mark_job_failed.s(job_id=job_id)))
+            logger.info("scrape_site dispatched %s pages: %s", len(urls), job_id)
+            return {"job_id": job_id, "status": "dispatched", "pages": len(urls)}
 
-            logger.info("Job %s fetching page %s", job_id, next_url)
-            time.sleep(site.rate_limit_ms / 1000.0)  # polite delay
-            try:
-                resp = requests.get(next_url, headers=headers, timeout=10)
-                resp.raise_for_status()
-            except Exception as e:
-                errors += 1
-                ScrapeError.objects.create(job=job, url=next_url, error_type="network", message=str(e))
-                # try to continue to next page if possible
-                break
-
-            fetched += 1
-            pages_scraped.append(next_url)
-            soup = BeautifulSoup(resp.text, "lxml")
-
-            # find quote elements
-            quote_nodes = soup.select(site.quote_selector)
-            author_nodes = soup.select(site.author_selector) if site.author_selector else []
-
-            # heuristics: if number of authors matches quotes, pair them; else use parent traversal
-            for i, qnode in enumerate(quote_nodes):
-                try:
-                    text = qnode.get_text(separator=" ", strip=True)
-                    author_name = None
-                    if author_nodes and i < len(author_nodes):
-                        author_name = author_nodes[i].get_text(separator=" ", strip=True)
-                    else:
-                        # Try common patterns: look for sibling or nearest author selector inside qnode
-                        possible = qnode.select_one(site.author_selector) if site.author_selector else None
-                        if possible:
-                            author_name = possible.get_text(separator=" ", strip=True)
-
-                    # Save author (get_or_create) and quote, idempotent via hash
-                    with transaction.atomic():
-                        author = None
-                        if author_name:
-                            author, _ = Author.objects.get_or_create(name=author_name)
-                        h = compute_quote_hash(text, author_name)
-                        if not Quote.objects.filter(hash=h).exists():
-                            quote = Quote.objects.create(
-                                text=text,
-                                author=author,
-                                site=site,
-                                source_url=next_url,
-                                hash=h,
-                                saved_by_job=job,
-                            )
-                            saved += 1
-                except Exception as ex:
-                    errors += 1
-                    ScrapeError.objects.create(job=job, url=next_url, error_type="parse", message=str(ex))
-                    logger.exception("parse error on %s", next_url)
+        session = _get_session(site.base_url)
+        if next_url is None:
+            next_url = urljoin(site.base_url, site.start_path or "/")
+        while next_url and page_index < site.max_pages:
+            if not _claim_rate_slot(site):
+                # a fresh message rather than self.retry(): politeness waits must
+                # not use up the retry budget meant for network errors
+                self.apply_async(
+                    args=[job_id],
+                    kwargs={"next_url": next_url, "page_index": page_index},
+                    countdown=site.rate_limit_ms / 1000.0,
+                )
+                return {"job_id": job_id, "status": "throttled", "page_index": page_index}
 
+            logger.info("Job %s fetching page %s", job_id, next_url)
+            tree, fetched, saved, errors = _scrape_page(job, site, session, next_url)
             # update job counters after each page
             job.increment_counters(fetched=fetched, saved=saved, errors=errors)
-            # reset page-level counters (since increment_counters added them)
-            fetched = 0
-            saved = 0
-            errors = 0
-
-            # Decide next page
-            next_url = None
-            if site.pagination_selector:
-                nxt = soup.select_one(site.pagination_selector)
-                if nxt:
-                    href = nxt.get("href") or nxt.get("data-href")
-                    if href:
-                        # create absolute url
-                        next_url = urljoin(site.base_url, href)
-            else:
-                # fallback: try to find "a[rel=next]" or a link with "next" text
-                nxt = soup.select_one("a[rel=next]") or soup.find("a", string=lambda s: s and s.lower().strip() in ("next", "›", "»"))
-                if nxt and nxt.get("href"):
-                    next_url = urljoin(site.base_url, nxt.get("href"))
+            page_index += 1
+            if tree is None:
+                break
+
+            page_url = next_url
+            next_url = _next_page_url(site, tree)
 
             # avoid infinite loops if pagination links point to same page
-            if next_url and urlparse(next_url).path == urlparse(next_url).path:
-                # safe guard trivial loop (could be improved)
-                pass
+            if next_url and urldefrag(next_url).url == urldefrag(page_url).url:
+                logger.info("Job %s pagination points back to %s, stopping", job_id, page_url)
+                break
 
-        # One final job counter update to ensure totals are stored (if any remained)
-        job.increment_counters(fetched=fetched, saved=saved, errors=errors)
         # mark finished with success
         job.mark_finished(success=True)
         logger.info("scrape_site finished: %s", job_id)
@@ -151,7 +340,58 @@ def scrape_site(self, job_id: str):
     except Exception as fatal:
         # record fatal
         ScrapeError.objects.create(job=job, url=None, error_type="fatal", message=str(fatal))
-        job.increment_counters(fetched=fetched, saved=saved, errors=1)
+        job.increment_counters(errors=1)
         job.mark_finished(success=False)
         logger.exception("fatal error in scrape_job %s", job_id)
         raise
+
+
+# chord header results must reach the backend for finalize_job. acks_late requeues
+# a page whose worker dies; a redelivered page can't save a quote twice (hash
+# dedupe), but does add to quotes_fetched/errors_count again.
+@shared_task(bind=True, base=BaseTaskWithRetry, ignore_result=False, acks_late=True, reject_on_worker_lost=True)
+def parse_page(self, job_id: str, url: str):
+    """
+    Fetch and save one page of a fanned-out job.
+    Once the job is loaded, failures (including running out of rate-limit
+    requeues) are recorded on the job instead of raised, so the chord still
+    reaches finalize_job. Anything that fails the task itself, such as the
+    job not loading, fails the chord and mark_job_failed closes the job.
+    """
+    job, site = _load_job(job_id)
+    try:
+        if not _claim_rate_slot(site):
+            # retry keeps the task id the chord is waiting on; max_retries=None would
+            # fall back to the class's max_retries, so pass an explicit budget
+            raise self.retry(countdown=site.rate_limit_ms / 1000.0, max_retries=RATE_LIMIT_MAX_REQUEUES)
+        _, fetched, saved, errors = _scrape_page(job, site, _get_session(site.base_url), url, missing_ok=True)
+    except Retry:
+        raise
+    except Exception as ex:
+        ScrapeError.objects.create(job=job, url=url, error_type="fatal", message=str(ex))
+        logger.exception("fatal error in parse_page %s", url)
+        fetched, saved, errors = 0, 0, 1
+    job.increment_counters(fetched=fetched, saved=saved, errors=errors)
+    return {"url": url, "fetched": fetched, "saved": saved, "errors": errors}
+
+
+@shared_task(bind=True, base=BaseTaskWithRetry, ignore_result=True)
+def finalize_job(self, results, job_id: str):
+    """Chord callback: all pages are done, settle the job status from its counters."""
+    job = ScrapeJob.objects.get(pk=job_id)
+    job.mark_finished(success=True)
+    logger.info("scrape_site finished: %s", job_id)
+    return {"job_id": job_id, "status": "done", "pages": len(results)}
+
+
+@shared_task(ignore_result=True)
+def mark_job_failed(request, exc, traceback, job_id: str):
+    """
+    Chord error callback: a page task or finalize_job failed, so finalize_job
+    will never close the job. Record the error and mark the job FAILED.
+    """
+    logger.error("scrape chord failed for job %s: %s", job_id, exc)
+    job = ScrapeJob.objects.get(pk=job_id)
+    ScrapeError.objects.create(job=job, url=None, error_type="fatal", message=str(exc))
+    job.increment_counters(errors=1)
+    job.mark_finished(success=False)
@@ -1,3 +1,466 @@
-from django.test import TestCase
+import io
+import time
+from unittest import mock
 
-# Create your tests here.
+import requests
+from celery.backends.cache import CacheBackend
+from celery.backends.rpc import RPCBackend
+from celery.exceptions import Retry
+from django.db import DataError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from requests.structures import CaseInsensitiveDict
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from requests.utils import get_encoding_from_headers
+
+from . import caches, tasks
+from .models import Author, ScrapeJob, ScrapeSite, Quote, compute_quote_hash
+from .serializers import QuoteReadSerializer, QuoteSerializer
+
+BASE_URL = "http://quotes.test"
+
+
+def make_response(body: bytes, status_code: int = 200, content_type: str = "text/html; charset=utf-8"):
+    """A real requests.Response backed by an in-memory body, as a session would return it."""
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp.headers = CaseInsensitiveDict({"Content-Type": content_type})
+    resp.encoding = get_encoding_from_headers(resp.headers)
+    resp.raw = io.BytesIO(body)
+    return resp
+
+
+def patch_result_backend(backend):
+    return mock.patch.object(tasks.scrape_site.app, "_backend_cache", backend)
+
+
+class FakeSession:
+    """Serves canned pages by URL; anything else is a 404."""
+
+    def __init__(self, pages: dict):
+        self.pages = pages
+        self.requested = []
+
+    def get(self, url, **kwargs):
+        self.requested.append(url)
+        page = self.pages.get(url)
+        if page is None:
+            return make_response(b"", status_code=404)
+        return page() if callable(page) else make_response(page)
+
+
+def quote_page(n: int, last: int) -> bytes:
+    nxt = f'<li class="next"><a href="/page/{n + 1}/">Next</a></li>' if n < last else ""
+    return (
+        f'<html><body><div class="quote"><span class="text">Quote {n}</span>'
+        f'<small class="author">Author {n}</small></div>{nxt}</body></html>'
+    ).encode("utf-8")
+
+
+@override_settings(SCRAPER_RATE_LIMIT_REDIS_URL="")
+class ScraperTaskTestCase(TestCase):
+    pages = 8
+
+    def setUp(self):
+        tasks._get_redis.cache_clear()
+        tasks._LOCAL_SLOTS.clear()
+        self.site = ScrapeSite.objects.create(
+            name="quotes",
+            base_url=BASE_URL,
+            start_path="/page/1/",
+            quote_selector="div.quote span.text",
+            author_selector="div.quote small.author",
+            rate_limit_ms=500,
+            max_pages=50,
+        )
+        self.job = ScrapeJob.objects.create(site=self.site)
+        self.session = FakeSession(
+            {f"{BASE_URL}/page/{n}/": quote_page(n, self.pages) for n in range(1, self.pages + 1)}
+        )
+        patcher = mock.patch.object(tasks, "_get_session", return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class ScrapeSiteRateLimitTests(ScraperTaskTestCase):
+    def test_throttled_walk_requeues_until_all_pages_are_scraped(self):
+        with mock.patch.object(tasks.scrape_site, "apply_async") as requeue:
+            result = tasks.scrape_site(str(self.job.id))
+            deliveries = 1
+            # simulate the worker: each requeue is delivered once its countdown has elapsed
+            while requeue.called:
+                call = requeue.call_args.kwargs
+                self.assertEqual(call["countdown"], 0.5)
+                requeue.reset_mock()
+                tasks._LOCAL_SLOTS.clear()
+                result = tasks.scrape_site(*call["args"], **call["kwargs"])
+                deliveries += 1
+
+        self.assertEqual(result["status"], "done")
+        self.assertEqual(deliveries, self.pages)
+        self.assertEqual(len(self.session.requested), self.pages)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, ScrapeJob.Status.SUCCESS)
+        self.assertEqual(self.job.quotes_fetched, self.pages)
+        self.assertEqual(self.job.quotes_saved, self.pages)
+        self.assertFalse(self.job.errors.exists())
+
+    def test_throttled_parse_page_uses_its_own_retry_budget(self):
+        self.assertTrue(tasks._claim_rate_slot(self.site))
+        with mock.patch.object(tasks.parse_page, "retry", side_effect=Retry()) as retry:
+            with self.assertRaises(Retry):
+                tasks.parse_page(str(self.job.id), f"{BASE_URL}/page/1/")
+        self.assertEqual(retry.call_args.kwargs["max_retries"], tasks.RATE_LIMIT_MAX_REQUEUES)
+        self.assertEqual(self.session.requested, [])
+
+
+class ScrapePageRowErrorTests(ScraperTaskTestCase):
+    pages = 3
+
+    def setUp(self):
+        super().setUp()
+        self.site.rate_limit_ms = 0
+        self.site.save()
+
+    def test_overlong_author_is_a_parse_error_and_the_walk_continues(self):
+        long_name = "x" * (tasks.AUTHOR_NAME_MAX_LENGTH + 1)
+        self.session.pages[f"{BASE_URL}/page/1/"] = quote_page(1, self.pages).replace(
+            b"</body>",
+            f'<div class="quote"><span class="text">Long</span><small class="author">{long_name}</small></div></body>'.encode(),
+        )
+        tasks.scrape_site(str(self.job.id))
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, ScrapeJob.Status.PARTIAL)
+        self.assertEqual((self.job.quotes_fetched, self.job.quotes_saved, self.job.errors_count), (3, 3, 1))
+        self.assertEqual(self.job.errors.get().error_type, "parse")
+
+    def test_database_error_costs_only_the_page(self):
+        real_insert_new = Quote.insert_new
+
+        def insert_new(quotes, **kwargs):
+            if quotes[0].source_url.endswith("/page/2/"):
+                raise DataError("value too long for type character varying(1000)")
+            return real_insert_new(quotes, **kwargs)
+
+        with mock.patch.object(Quote, "insert_new", side_effect=insert_new):
+            tasks.scrape_site(str(self.job.id))
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, ScrapeJob.Status.PARTIAL)
+        self.assertEqual((self.job.quotes_fetched, self.job.quotes_saved, self.job.errors_count), (3, 2, 1))
+        self.assertEqual(self.job.errors.get().url, f"{BASE_URL}/page/2/")
+
+    def test_overlong_page_url_is_a_parse_error(self):
+        url = f"{BASE_URL}/page/1/?q=" + "x" * tasks.SOURCE_URL_MAX_LENGTH
+        self.session.pages[url] = quote_page(1, 1)
+        self.assertEqual(tasks._scrape_page(self.job, self.site, self.session, url)[1:], (1, 0, 1))
+        error = self.job.errors.get()
+        self.assertEqual((error.error_type, error.url), ("parse", None))
+        self.assertFalse(Quote.objects.exists())
+
+
+class PaginationLoopTests(ScraperTaskTestCase):
+    def setUp(self):
+        super().setUp()
+        self.site.rate_limit_ms = 0
+        self.site.save()
+
+    def link_page(self, text: str, href: str) -> bytes:
+        return (
+            f'<html><body><div class="quote"><span class="text">{text}</span>'
+            f'<small class="author">Someone</small></div><a href="{href}">Next</a></body></html>'
+        ).encode("utf-8")
+
+    def assert_walk(self, requested: list[str]):
+        tasks.scrape_site(str(self.job.id))
+        self.job.refresh_from_db()
+        self.assertEqual(self.session.requested, requested)
+        self.assertEqual(self.job.status, ScrapeJob.Status.SUCCESS)
+
+    def test_page_linking_to_itself_is_fetched_once(self):
+        for href in ("/page/1/", "/page/1/#quotes"):
+            with self.subTest(href=href):
+                self.session.requested.clear()
+                self.job = ScrapeJob.objects.create(site=self.site)
+                self.session.pages[f"{BASE_URL}/page/1/"] = self.link_page(f"Loop via {href}", href)
+                self.assert_walk([f"{BASE_URL}/page/1/"])
+
+    def test_query_string_is_part_of_the_page_url(self):
+        self.site.start_path = "/list?page=1"
+        self.site.save()
+        self.session.pages = {
+            f"{BASE_URL}/list?page=1": self.link_page("One", "/list?page=2"),
+            f"{BASE_URL}/list?page=2": self.link_page("Two", "/list?page=2#top"),
+        }
+        self.assert_walk([f"{BASE_URL}/list?page=1", f"{BASE_URL}/list?page=2"])
+        self.assertEqual(self.job.quotes_saved, 2)
+
+
+class ScrapeSiteChordTests(ScraperTaskTestCase):
+    def setUp(self):
+        super().setUp()
+        self.site.page_url_template = "/page/{page}/"
+        self.site.max_pages = 3
+        self.site.save()
+        # a chord-capable backend; the project default (rpc://) can't run chords
+        backend = patch_result_backend(CacheBackend(app=tasks.scrape_site.app, backend="memory"))
+        backend.start()
+        self.addCleanup(backend.stop)
+
+    def test_chord_body_has_failure_callback(self):
+        with mock.patch.object(tasks, "chord") as chord:
+            result = tasks.scrape_site(str(self.job.id))
+        self.assertEqual(result["pages"], 3)
+        body = chord.return_value.call_args.args[0]
+        self.assertEqual(body.task, tasks.finalize_job.name)
+        [errback] = body.options["link_error"]
+        self.assertEqual(errback["task"], tasks.mark_job_failed.name)
+        self.assertEqual(errback["kwargs"], {"job_id": str(self.job.id)})
+
+    def test_real_chord_scrapes_every_page(self):
+        self.site.rate_limit_ms = 0
+        self.site.save()
+        conf = tasks.scrape_site.app.conf
+        self.addCleanup(setattr, conf, "task_always_eager", conf.task_always_eager)
+        # eager mode runs the chord header and body in-process
+        conf.task_always_eager = True
+        tasks.scrape_site(str(self.job.id))
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "SUCCESS")
+        self.assertEqual((self.job.quotes_fetched, self.job.quotes_saved), (3, 3))
+
+    def test_backend_without_chords_falls_back_to_sequential_walk(self):
+        rpc_backend = RPCBackend(app=tasks.scrape_site.app)
+        with patch_result_backend(rpc_backend), mock.patch.object(tasks.scrape_site, "apply_async") as requeue:
+            tasks.scrape_site(str(self.job.id))
+            while requeue.called:
+                call = requeue.call_args
+                requeue.reset_mock()
+                tasks._LOCAL_SLOTS.clear()
+                tasks.scrape_site(*call.kwargs["args"], **call.kwargs["kwargs"])
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "SUCCESS")
+        self.assertEqual(self.job.quotes_saved, 3)
+        self.assertFalse(self.job.errors.exists())
+
+    def test_only_page_tasks_ack_late(self):
+        # a redelivered scrape_site would re-count pages and reset started_at
+        self.assertTrue(tasks.parse_page.acks_late)
+        self.assertFalse(tasks.scrape_site.acks_late)
+
+    def test_mark_job_failed_closes_the_job(self):
+        self.job.mark_running()
+        tasks.mark_job_failed(None, RuntimeError("page task lost"), None, job_id=str(self.job.id))
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, ScrapeJob.Status.FAILED)
+        self.assertEqual(self.job.errors_count, 1)
+        self.assertEqual(self.job.errors.get().message, "page task lost")
+
+    def test_parse_page_records_exhausted_requeues_instead_of_failing(self):
+        self.assertTrue(tasks._claim_rate_slot(self.site))
+        with mock.patch.object(tasks.parse_page, "retry", side_effect=RuntimeError("max retries")):
+            result = tasks.parse_page(str(self.job.id), f"{BASE_URL}/page/1/")
+        self.assertEqual(result["errors"], 1)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.errors_count, 1)
+        self.assertEqual(self.job.errors.get().error_type, "fatal")
+
+    def test_parse_page_saves_quotes_and_treats_404_as_end(self):
+        page = tasks.parse_page(str(self.job.id), f"{BASE_URL}/page/1/")
+        tasks._LOCAL_SLOTS.clear()
+        missing = tasks.parse_page(str(self.job.id), f"{BASE_URL}/page/99/")
+        self.assertEqual((page["fetched"], page["saved"], page["errors"]), (1, 1, 0))
+        self.assertEqual((missing["fetched"], missing["saved"], missing["errors"]), (0, 0, 0))
+        self.assertEqual(Quote.objects.get().author.name, "Author 1")
+
+
+class ScrapePageEncodingTests(ScraperTaskTestCase):
+    url = f"{BASE_URL}/page/1/"
+    text = "Café “naïve” — déjà vu"
+
+    def scrape(self, body: bytes, content_type: str):
+        self.session.pages[self.url] = lambda: make_response(body, content_type=content_type)
+        tasks._scrape_page(self.job, self.site, self.session, self.url)
+        return Quote.objects.get().text
+
+    def page(self, encoding: str, head: str = "") -> bytes:
+        return (
+            f'<html><head>{head}</head><body><div class="quote"><span class="text">{self.text}</span>'
+            f'<small class="author">Someone</small></div></body></html>'
+        ).encode(encoding)
+
+    def test_header_charset_is_used_to_decode(self):
+        self.assertEqual(self.scrape(self.page("cp1252"), "text/html; charset=windows-1252"), self.text)
+
+    def test_meta_charset_is_used_without_header_charset(self):
+        body = self.page("cp1252", head='<meta charset="windows-1252">')
+        self.assertEqual(self.scrape(body, "text/html"), self.text)
+
+    def test_utf8_is_the_default(self):
+        self.assertEqual(self.scrape(self.page("utf-8"), "text/html"), self.text)
+
+
+class LookupCacheTests(TestCase):
+    def setUp(self):
+        caches.clear_site_cache()
+        caches.clear_author_cache()
+        self.addCleanup(caches.clear_author_cache)
+        self.site = ScrapeSite.objects.create(name="quotes", base_url=BASE_URL, quote_selector="span.text")
+
+    def expired(self, ttl: int):
+        return mock.patch.object(caches.time, "monotonic", return_value=time.monotonic() + ttl + 1)
+
+    def test_quote_for_inactive_site_is_rejected(self):
+        self.site.active = False
+        self.site.save()
+        serializer = QuoteSerializer(data={"text": "Hi", "site": self.site.pk, "author_name": "Someone"})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("site", serializer.errors)
+
+    def test_quote_create_resolves_author_name(self):
+        serializer = QuoteSerializer(data={"text": "Hi", "site": self.site.pk, "author_name": "Someone"})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        quote = serializer.save()
+        self.assertEqual(Quote.objects.get(pk=quote.pk).author.name, "Someone")
+
+    def test_sites_are_not_shared_between_callers(self):
+        self.assertIsNot(caches.get_site(self.site.pk), caches.get_site(self.site.pk))
+
+    def test_site_change_from_another_process_is_seen_after_ttl(self):
+        self.assertTrue(caches.get_site(self.site.pk).active)
+        # a queryset update sends no signal, like a save made in another process
+        ScrapeSite.objects.filter(pk=self.site.pk).update(active=False)
+        with self.assertNumQueries(0):
+            self.assertTrue(caches.get_site(self.site.pk).active)
+        with self.expired(caches.SITE_CACHE_TTL):
+            self.assertFalse(caches.get_site(self.site.pk).active)
+
+    def test_author_id_is_cached_until_ttl(self):
+        author_id = caches.get_author_id("Someone")
+        Author.objects.filter(pk=author_id).update(name="Someone Else")
+        with self.assertNumQueries(0):
+            self.assertEqual(caches.get_author_id("Someone"), author_id)
+        with self.expired(caches.AUTHOR_CACHE_TTL):
+            self.assertNotEqual(caches.get_author_id("Someone"), author_id)
+
+
+class BulkInsertTests(TestCase):
+    def setUp(self):
+        self.site = ScrapeSite.objects.create(name="quotes", base_url=BASE_URL, quote_selector="span.text")
+        self.author = Author.objects.create(name="Someone")
+
+    def quote(self, text: str) -> Quote:
+        return Quote(text=text, author=self.author, site=self.site, hash=compute_quote_hash(text, self.author.name))
+
+    def test_insert_new_counts_only_new_quotes(self):
+        Quote.objects.create(text="Old", author=self.author, site=self.site)
+        quotes = [self.quote(t) for t in ["Old", "A", "B", "A", "C", "B"]]
+        # batch_size=2 also puts duplicates in separate statements
+        self.assertEqual(Quote.insert_new(quotes, batch_size=2), 3)
+        self.assertEqual(Quote.insert_new([self.quote("A"), self.quote("D")]), 1)
+        self.assertCountEqual(Quote.objects.values_list("text", flat=True), ["Old", "A", "B", "C", "D"])
+
+    def test_insert_new_fallback_counts_only_new_quotes(self):
+        Quote.objects.create(text="Old", author=self.author, site=self.site)
+        # SQLite < 3.35 has no RETURNING
+        with mock.patch.object(type(connection.features), "can_return_rows_from_bulk_insert", False):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(Quote.insert_new([self.quote("Old"), self.quote("A")]), 1)
+        self.assertNotIn("RETURNING", ctx.captured_queries[-1]["sql"])
+        self.assertEqual(Quote.objects.count(), 2)
+
+    def test_insert_new_batches_stay_under_the_parameter_limit(self):
+        quotes = [self.quote(f"Q{n}") for n in range(5)]
+        with mock.patch.object(connection.ops, "bulk_batch_size", return_value=2):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(Quote.insert_new(quotes), 5)
+        self.assertEqual(len(ctx.captured_queries), 3)
+
+    def test_insert_new_populates_timestamps(self):
+        Quote.insert_new([self.quote("A")])
+        quote = Quote.objects.get()
+        self.assertIsNotNone(quote.created_at)
+        self.assertIsNotNone(quote.updated_at)
+
+    def test_author_ensure_returns_existing_id_on_conflict(self):
+        self.assertEqual(Author.ensure("Someone"), self.author.pk)
+        new_id = Author.ensure("Someone Else")
+        self.assertEqual(Author.ensure("Someone Else"), new_id)
+        self.assertEqual(Author.objects.count(), 2)
+        created = Author.objects.get(pk=new_id)
+        self.assertIsNotNone(created.created_at)
+        self.assertIsNotNone(created.updated_at)
+
+    def test_author_ensure_falls_back_without_upsert_returning(self):
+        # SQLite < 3.35 has ON CONFLICT but no RETURNING
+        with mock.patch.object(connection.features, "can_return_columns_from_insert", False):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(Author.ensure("Someone"), self.author.pk)
+                self.assertEqual(Author.objects.get(pk=Author.ensure("Someone Else")).name, "Someone Else")
+        self.assertFalse(any("ON CONFLICT" in q["sql"] for q in ctx.captured_queries))
+
+
+class QuoteReadSerializerTests(TestCase):
+    def setUp(self):
+        caches.clear_author_cache()
+        self.addCleanup(caches.clear_author_cache)
+        self.site = ScrapeSite.objects.create(name="quotes", base_url=BASE_URL, quote_selector="span.text")
+        self.author = Author.objects.create(name="Someone")
+        self.job = ScrapeJob.objects.create(site=self.site)
+        self.full = Quote.objects.create(
+            text="Full", author=self.author, site=self.site, source_url=f"{BASE_URL}/page/1/", saved_by_job=self.job
+        )
+        self.bare = Quote.objects.create(text="Bare", site=self.site)
+
+    def test_output_matches_model_serializer(self):
+        for quote in (self.full, self.bare):
+            with self.subTest(text=quote.text):
+                read = JSONRenderer().render(QuoteReadSerializer(quote).data)
+                self.assertEqual(read, JSONRenderer().render(QuoteSerializer(quote).data))
+
+    def test_get_uses_read_serializer(self):
+        client = APIClient()
+        with mock.patch.object(
+            QuoteReadSerializer, "to_representation", autospec=True, side_effect=QuoteReadSerializer.to_representation
+        ) as to_representation:
+            listing = client.get("/api/quotes/")
+            detail = client.get(f"/api/quotes/{self.full.pk}/")
+        self.assertEqual((listing.status_code, detail.status_code), (200, 200))
+        self.assertEqual(to_representation.call_count, 3)
+        self.assertEqual(detail.json()["saved_by_job"], str(self.job.pk))
+
+    def test_post_validates_through_model_serializer(self):
+        client = APIClient()
+        invalid = client.post("/api/quotes/", {"text": "New"}, format="json")
+        self.assertEqual(invalid.status_code, 400)
+        self.assertIn("site", invalid.json())
+        created = client.post(
+            "/api/quotes/", {"text": "New", "site": self.site.pk, "author_name": "Someone"}, format="json"
+        )
+        self.assertEqual(created.status_code, 201)
+        self.assertEqual(created.json()["author"], self.author.pk)
+
+
+class QuoteSaveHashTests(TestCase):
+    def setUp(self):
+        self.site = ScrapeSite.objects.create(name="quotes", base_url=BASE_URL, quote_selector="span.text")
+        self.author = Author.objects.create(name="Someone")
+        self.expected_hash = compute_quote_hash("Hi", "Someone")
+
+    def save(self, quote: Quote, queries: int) -> Quote:
+        with self.assertNumQueries(queries):
+            quote.save()
+        self.assertEqual(quote.hash, self.expected_hash)
+        return quote
+
+    def test_known_author_name_needs_only_the_insert(self):
+        quote = Quote(text="Hi", author_id=self.author.pk, site=self.site)
+        quote._author_name_cache = "Someone"
+        self.save(quote, 1)
+
+    def test_loaded_author_is_not_queried_again(self):
+        self.save(Quote(text="Hi", author=self.author, site=self.site), 1)
+
+    def test_author_id_only_looks_up_the_name(self):
+        quote = self.save(Quote(text="Hi", author_id=self.author.pk, site=self.site), 2)
+        self.assertEqual(quote.hash, compute_quote_hash(quote.text, Author.objects.get(pk=quote.author_id).name))
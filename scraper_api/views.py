@@ -9,6 +9,7 @@ from .serializers import (
     ScrapeSiteSerializer,
     AuthorSerializer,
     QuoteSerializer,
+    QuoteReadSerializer,
     ScrapeJobSerializer,
     ScrapeErrorSerializer,
 )
@@ -30,11 +31,18 @@ class AuthorViewSet(viewsets.ModelViewSet):
 
 
 class QuoteViewSet(viewsets.ModelViewSet):
-    queryset = Quote.objects.select_related("author", "site").all()
+    # responses only carry FK ids, so no joins are needed
+    queryset = Quote.objects.all()
     serializer_class = QuoteSerializer
     filterset_fields = ["site", "author"]
     search_fields = ["text"]
 
+    def get_serializer_class(self):
+        # plain reads use the hand-written serializer; writes (and the browsable API forms) keep the ModelSerializer
+        if self.request is not None and self.request.method == "GET":
+            return QuoteReadSerializer
+        return QuoteSerializer
+
 
 class ScrapeErrorViewSet(viewsets.ModelViewSet):
     queryset = ScrapeError.objects.select_related("job").all()